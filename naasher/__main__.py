@@ -68,21 +68,12 @@ class Application(object):
                 default=self.default_command,
             )
             command_parser.add_argument("-h", "--help", action="store_true")
-            for p in self.parsers.values():
-                p.add_argument(
-                    "command",
-                    nargs="?",
-                    choices=self.commands.keys(),
-                    default=self.default_command,
-                )
-            known_args = command_parser.parse_known_args()[0]
+            known_args, command_args = command_parser.parse_known_args()
             if known_args.help:
                 self.parser_for_help.print_help()
                 self.parser_for_help.exit()
-            args = self.parsers[known_args.command].parse_args()
-            self.commands[known_args.command](
-                **{k: v for k, v in args.__dict__.items() if k != "command"}
-            )
+            args = self.parsers[known_args.command].parse_args(command_args)
+            self.commands[known_args.command](**vars(args))
         except Exception as e:
             LOGGER.error(f"Error running the CLI application `{self.name}`")
 
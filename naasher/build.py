@@ -22,32 +22,45 @@
 
 import os
 import re
+import glob
 import ast
-import json
 import inspect
+import threading
 
 from typing import cast, Any, Callable, Iterable, Generator
 from datetime import datetime
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 
 from pathlib import Path
-from bs4 import BeautifulSoup as bs4, ResultSet, Tag
-from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
+import orjson
+from bs4 import BeautifulSoup as bs4, NavigableString, ResultSet, Tag
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    Template,
+    TemplateError,
+    select_autoescape,
+)
 from markupsafe import Markup, escape
 
 from .mdex import (
-    create_md_renderer,
+    get_renderer as get_md_renderer,
     get_stylesheet as get_md_stylesheet,
+    render_math,
     MATH_EXPR_PATTERN,
 )
 from .jdatetime import jstrftime, jalali_to_gregorian
 from .common import LOGGER
-from .js import temml, csso, uglifyjs3  # type: ignore
+from .js import csso, uglifyjs3  # type: ignore
 
 reCssFontFace = re.compile(r"@font\-face\s*\{[^\{\}]+\}")
 reCssFontFaceUrl = re.compile(r"url\(([^\(\)]+)\)")
 reMathExpr = re.compile(MATH_EXPR_PATTERN)
+reSolarHijriDate = re.compile(r"^(\d\d(\d\d)?)-(\d\d?)-(\d\d?)(T.*)?$")
 
-render_markdown = create_md_renderer()
+FARSI_DIGITS_TABLE = str.maketrans("0123456789", "۰۱۲۳۴۵۶۷۸۹")
 
 
 class Keys:
@@ -57,7 +70,7 @@ class Keys:
     CHILD = "child"
     DIR_LISTING_TEMPLATE = "dir_listing_template"
     UTF8 = "utf-8"
-    HTML_PARSER = "html.parser"
+    HTML_PARSER = "lxml"
     HEAD = "head"
     BODY = "body"
     LINK = "link"
@@ -75,15 +88,21 @@ class Keys:
 class DictWrapper(object):
     def __init__(self, n: str, d: dict):
         self.wrapped_dict_name = n
-        self.wrapped_dict = {k: DictWrapper.__wrap(f"{n}.{k}", v) for k, v in d.items()}
+        self.wrapped_dict = d
+        self.wrapped_items: dict[str, Any] = {}
 
     def __contains__(self, key: str):
         return key in self.wrapped_dict
 
     def __getitem__(self, key: str):
-        result = self.wrapped_dict[key]
-        if isinstance(result, dict):
-            return DictWrapper(f"{self.wrapped_dict_name}.{key}", result)
+        try:
+            return self.wrapped_items[key]
+        except KeyError:
+            pass
+        result = DictWrapper.__wrap(
+            f"{self.wrapped_dict_name}.{key}", self.wrapped_dict[key]
+        )
+        self.wrapped_items[key] = result
         return result
 
     @staticmethod
@@ -98,23 +117,11 @@ class DictWrapper(object):
             return DictWrapper(n, o)
         return o
 
-    @staticmethod
-    def __unwrap(o):
-        if isinstance(o, tuple):
-            return tuple(DictWrapper.__unwrap(e) for e in o)
-        elif isinstance(o, list):
-            return [DictWrapper.__unwrap(e) for e in o]
-        elif isinstance(o, DictWrapper):
-            return {k: DictWrapper.__unwrap(v) for k, v in o.wrapped_dict.items()}
-        return o
-
     def items(self):
-        for k, v in self.wrapped_dict.items():
-            yield k, DictWrapper.__unwrap(v)
+        yield from self.wrapped_dict.items()
 
     def values(self):
-        for v in self.wrapped_dict.values():
-            yield DictWrapper.__unwrap(v)
+        yield from self.wrapped_dict.values()
 
 
 def read_meta(path: Path) -> dict[str, Any]:
@@ -129,7 +136,7 @@ def read_meta(path: Path) -> dict[str, Any]:
                     vv = vv[: -len(suffix)]
                     break
             if is_solar_hijri:
-                m = re.match(r"^(\d\d(\d\d)?)-(\d\d?)-(\d\d?)(T.*)?$", vv)
+                m = reSolarHijriDate.match(vv)
                 if not m:
                     LOGGER.warning(f"Invalid date string: `{v}`")
                     return None
@@ -142,7 +149,7 @@ def read_meta(path: Path) -> dict[str, Any]:
             return datetime.fromisoformat(v)
         return v
 
-    meta = json.loads(path.read_text(encoding=Keys.UTF8))
+    meta = orjson.loads(path.read_bytes())
     meta = {k: normalize(k, v) for k, v in meta.items()}
     return meta
 
@@ -158,21 +165,29 @@ def build_static_site(
     THEME_PATH = Path(theme_dir).absolute()
     BUILD_PATH = Path(build_dir).absolute()
 
+    JINJA_CACHE_PATH = BUILD_PATH / ".jinja_cache"
+    JINJA_CACHE_PATH.mkdir(mode=0o755, parents=True, exist_ok=True)
+
     jinja_env = Environment(
         loader=FileSystemLoader(str(THEME_PATH)),
         autoescape=select_autoescape(["html", "css", "js"]),
+        bytecode_cache=FileSystemBytecodeCache(
+            directory=str(JINJA_CACHE_PATH), pattern="__jinja2_%s.cache"
+        ),
+        cache_size=-1,
     )
 
+    md_stylesheet: str = csso(get_md_stylesheet())["css"]
+
     def write_bytes(path: Path, get_bytes: Callable[[], bytes]):
-        if (
-            not force_recreation or path.suffix not in [".html", ".css"]
-        ) and path.exists():
+        existed = path.exists()
+        if (not force_recreation or path.suffix not in [".html", ".css"]) and existed:
             LOGGER.info(f"Keeping existing `{path.relative_to(BUILD_PATH)}`")
         else:
             try:
                 content = get_bytes()
                 if content is not None:
-                    if path.exists():
+                    if existed:
                         LOGGER.warning(f"Recreating `{path.relative_to(BUILD_PATH)}`")
                     else:
                         LOGGER.info(f"Creating `{path.relative_to(BUILD_PATH)}`")
@@ -189,8 +204,20 @@ def build_static_site(
     def id__(p: Path):
         return p.relative_to(SOURCE_PATH).as_posix()
 
+    theme_index: dict[str, Path] = {}
+    for parent, _, files in os.walk(THEME_PATH):
+        for file in files:
+            theme_index.setdefault(file, Path(parent, file))
+
+    def find_theme_resource(name: str) -> Path | None:
+        if "/" in name or glob.has_magic(name):
+            return next(THEME_PATH.glob(f"**/{name}"), None)
+        return theme_index.get(name)
+
     static_site_data: dict[str, tuple[dict, dict]] = {}
+    children_index: dict[str, dict[str, tuple[dict, dict]]] = {}
     missing_resources: set[str] = set()
+    shared_state_lock = threading.Lock()
 
     def create_utility_function_dict():
         nonlocal static_site_data
@@ -213,19 +240,18 @@ def build_static_site(
             return find_url(id)
 
         def handle_math(text: str):
-            result = Markup()
+            # Undefined template values have no length and render as nothing
+            if not text:
+                return Markup()
+            parts: list[Markup] = []
             i = 0
-            while i < len(text):
-                m = re.search(reMathExpr, text[i:])
-                if not m:
-                    break
-                result += escape(
-                    text[i : i + m.start()].replace("&nbsp;", "\u00A0")
-                ) + Markup(temml(m.group()[1:-1]))
-                i += m.end()
+            for m in reMathExpr.finditer(text):
+                parts.append(escape(text[i : m.start()].replace("&nbsp;", "\u00A0")))
+                parts.append(Markup(render_math(m.group()[1:-1], False)))
+                i = m.end()
             if i < len(text):
-                result += escape(text[i:].replace("&nbsp;", "\u00A0"))
-            return result
+                parts.append(escape(text[i:].replace("&nbsp;", "\u00A0")))
+            return Markup().join(parts)
 
         def short_gregorian(d: datetime):
             return jstrftime(d, "%b, %u %Y")
@@ -280,12 +306,13 @@ def build_static_site(
         ):
             if names:
                 for name in names if isinstance(names, list) else [names]:
-                    resource = next(THEME_PATH.glob(f"**/{name}{suffix or ''}"), None)
+                    resource = find_theme_resource(f"{name}{suffix or ''}")
                     if resource:
                         return "/" + str(resource.relative_to(THEME_PATH))
-                missing_resources.add(f"{name}{suffix or ''}")
+                with shared_state_lock:
+                    missing_resources.add(f"{name}{suffix or ''}")
             if default:
-                resource = next(THEME_PATH.glob(f"**/{default}{suffix or ''}"), None)
+                resource = find_theme_resource(f"{default}{suffix or ''}")
                 if resource:
                     return "/" + str(resource.relative_to(THEME_PATH))
             return "#"
@@ -337,14 +364,7 @@ def build_static_site(
 
         result = template.render(
             static_site_data=DictWrapper("static_site_data", static_site_data),
-            children=DictWrapper(
-                "children",
-                {
-                    k: v
-                    for k, v in static_site_data.items()
-                    if k.startswith(item_id) and len(k) > len(item_id)
-                },
-            ),
+            children=DictWrapper("children", children_index.get(item_id, {})),
             meta=DictWrapper("meta", meta),
             mds=DictWrapper("mds", mds),
             item_id=item_id,
@@ -364,32 +384,23 @@ def build_static_site(
                 html_head.append(new_css_node)
         if html_body:
             if farsi:
-                for n in html_body.find_all(text=True):
-                    do_not_change_digits = False
-                    p = n.parent
-                    while p:
-                        if p.name.lower() in ["section", "pre"]:
-                            do_not_change_digits = True
-                            break
-                        p = p.parent
-                    if do_not_change_digits:
-                        p = n.parent
-                        while p:
-                            if p.name.lower() in ["math"]:
-                                do_not_change_digits = False
-                                break
-                            p = p.parent
-                    if do_not_change_digits:
-                        continue
-                    value = n.string
-                    if value:
-                        n.replace_with(
-                            re.sub(
-                                "[0-9]",
-                                lambda m: chr(ord(m.group(0)) - ord("0") + ord("۰")),
-                                value,
-                            )
-                        )
+                # Digits are kept inside `section` and `pre` unless they are
+                # part of a `math` element
+                stack: list[tuple[Tag, bool, bool]] = [(html_body, False, False)]
+                while stack:
+                    tag, keep_digits, in_math = stack.pop()
+                    name = tag.name.lower()
+                    keep_digits = keep_digits or name in ["section", "pre"]
+                    in_math = in_math or name == "math"
+                    for n in list(tag.children):
+                        if isinstance(n, Tag):
+                            stack.append((n, keep_digits, in_math))
+                        elif isinstance(n, NavigableString) and (
+                            in_math or not keep_digits
+                        ):
+                            value = n.translate(FARSI_DIGITS_TABLE)
+                            if value != n:
+                                n.replace_with(type(n)(value))
             if js:
                 for item in js:
                     new_js_node = result.new_tag(Keys.SCRIPT)
@@ -399,14 +410,13 @@ def build_static_site(
         if html_head and mds:
             new_css_node = result.new_tag(Keys.STYLE)
             new_css_node[Keys.TYPE] = Keys.TEXT_CSS
-            new_css_node.string = csso(get_md_stylesheet())["css"]
+            new_css_node.string = md_stylesheet
             html_head.append(new_css_node)
-        result = result.encode(encoding=Keys.UTF8, formatter="html5")
         return result
 
     def render_template_by_template_name(
         name: str, item_id: str, relative_path: str, css: list[str], js: list[str]
-    ):
+    ) -> bs4:
         result = render_template(
             jinja_env.get_template(f"{name}.html"),
             item_id,
@@ -416,7 +426,7 @@ def build_static_site(
             js,
             name.endswith("_fa"),
         )
-        return result
+        return cast(bs4, result)
 
     def render_template_file(template: Path, item_id: str):
         return render_template(
@@ -428,29 +438,38 @@ def build_static_site(
             [],
         )
 
-    def gather_data_from_source_tree(p: Path):
-        nonlocal static_site_data
+    dependencies: list[str] = []
+    pending_writes: list[tuple[Path, Callable[[], bytes]]] = []
+    used_template_names: set[str] = set()
+
+    def generate_static_site_item(
+        p: Path,
+        default_template_name: str | None = None,
+        default_dir_listing_template_name: str | None = None,
+    ):
+        with os.scandir(p) as entries:
+            files: list[Path] = []
+            dirs: list[Path] = []
+            for entry in entries:
+                (files if entry.is_file() else dirs).append(Path(entry.path))
         meta = {}
         mds = {}
-        for c in p.iterdir():
-            if not c.is_file():
-                continue
+        for c in files:
             if c.name == "meta.json":
                 meta = read_meta(c)
             elif c.suffix == ".md":
-                mds[c.stem] = render_markdown(c.read_text())
-        static_site_data[id__(p)] = (meta, mds)
-        for c in p.iterdir():
-            if not c.is_file():
-                gather_data_from_source_tree(c)
-
-    dependencies: list[str] = []
-
-    def generate_static_site_item(
-        p: Path, default_template_name: str, default_dir_listing_template_name: str
-    ):
+                mds[c.stem] = get_md_renderer()(c.read_text())
         item_id = id__(p)
-        meta, mds = static_site_data[item_id]
+        static_site_data[item_id] = item = (meta, mds)
+        parts = item_id.split("/")
+        for i in range(1, len(parts)):
+            children_index.setdefault("/".join(parts[:i]), {})[item_id] = item
+        if default_template_name is None:
+            default_template_name = meta.get("default_template", "default_template")
+        if default_dir_listing_template_name is None:
+            default_dir_listing_template_name = meta.get(
+                "default_dir_listing_template", "default_dir_listing_template"
+            )
         child_default_template_name = default_template_name
         if f"{Keys.CHILD}_{Keys.TEMPLATE}" in meta:
             child_default_template_name = meta[f"{Keys.CHILD}_{Keys.TEMPLATE}"]
@@ -468,14 +487,7 @@ def build_static_site(
         o.mkdir(mode=0o755, parents=True, exist_ok=True)
         css = []
         js = []
-        for c in p.iterdir():
-            if not c.is_file():
-                generate_static_site_item(
-                    c,
-                    child_default_template_name,
-                    child_default_dir_listing_template_name,
-                )
-                continue
+        for c in files:
             is_binary_file = True
             if c.name == "meta.json":
                 is_binary_file = False
@@ -491,13 +503,22 @@ def build_static_site(
                 css.append(c.name)
             oc = o / c.name
 
-            write_bytes(
-                oc,
+            pending_writes.append(
                 (
-                    c.read_bytes
-                    if is_binary_file
-                    else lambda: render_template_file(c, item_id)
-                ),
+                    oc,
+                    (
+                        c.read_bytes
+                        if is_binary_file
+                        else partial(render_template_file, c, item_id)
+                    ),
+                )
+            )
+
+        for c in dirs:
+            generate_static_site_item(
+                c,
+                child_default_template_name,
+                child_default_dir_listing_template_name,
             )
 
         if meta or mds:
@@ -508,12 +529,13 @@ def build_static_site(
             template_name = default_dir_listing_template_name
             if Keys.DIR_LISTING_TEMPLATE in meta:
                 template_name = meta[Keys.DIR_LISTING_TEMPLATE]
+        used_template_names.add(template_name)
 
         def create_index_html_contents():
             html = render_template_by_template_name(
                 template_name, item_id, relative_path.as_posix(), css, js
             )
-            html = bs4(html, Keys.HTML_PARSER)
+            page_dependencies: list[str] = []
             html_head: Tag | None = html.find(Keys.HEAD)  # type: ignore
             html_body: Tag | None = html.find(Keys.BODY)  # type: ignore
             if html_head:
@@ -526,7 +548,7 @@ def build_static_site(
                         and link[Keys.HREF].strip().startswith("/")  # type: ignore
                     ):
                         dependency = link[Keys.HREF].strip()[1:]  # type: ignore
-                        dependencies.append(dependency)
+                        page_dependencies.append(dependency)
 
             if html_body:
                 all_elements_with_src: ResultSet[Tag] = html_body.find_all(
@@ -534,19 +556,29 @@ def build_static_site(
                 )
                 for element_with_src in all_elements_with_src:
                     if element_with_src[Keys.SRC].strip().startswith("/"):  # type: ignore
-                        dependencies.append(element_with_src[Keys.SRC].strip()[1:])  # type: ignore
+                        page_dependencies.append(element_with_src[Keys.SRC].strip()[1:])  # type: ignore
+            with shared_state_lock:
+                dependencies.extend(page_dependencies)
             return str(html).encode(encoding=Keys.UTF8)
 
-        write_bytes((o / "index.html"), create_index_html_contents)
+        pending_writes.append((o / "index.html", create_index_html_contents))
 
-    gather_data_from_source_tree(SOURCE_PATH)
+    generate_static_site_item(SOURCE_PATH)
 
-    root_meta, _ = static_site_data.get(".", ({}, None))
-    generate_static_site_item(
-        SOURCE_PATH,
-        root_meta.get("default_template", "default_template"),
-        root_meta.get("default_dir_listing_template", "default_dir_listing_template"),
-    )
+    # Compile the templates pages use up front so that the workers below do
+    # not race to compile the same template; broken ones are reported when used
+    for name in used_template_names:
+        try:
+            jinja_env.get_template(f"{name}.html")
+        except TemplateError:
+            pass
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        for future in [
+            executor.submit(write_bytes, path, get_bytes)
+            for path, get_bytes in pending_writes
+        ]:
+            future.result()
 
     def get_referenced_font_paths(css_contents: bytes):
         font_urls: set[str] = set()
@@ -593,7 +625,7 @@ def build_static_site(
             return f"@font-face {{\n  {font_rule};\n}}"
 
         def read_bytes():
-            description = json.loads(json_file.read_text())
+            description = orjson.loads(json_file.read_bytes())
             parent = json_file.parent
             common: dict[str, str | int | float] = {
                 k: v for k, v in description.items() if k != "files"
@@ -619,11 +651,15 @@ def build_static_site(
 
         return read_bytes
 
+    handled_dependencies: set[str] = set()
     next_level_dependencies = list(set(dependencies))
     while next_level_dependencies:
         dependencies = next_level_dependencies
         next_level_dependencies = []
         for dependency in dependencies:
+            if dependency in handled_dependencies:
+                continue
+            handled_dependencies.add(dependency)
             d = THEME_PATH / dependency
             o = BUILD_PATH / dependency
             if not force_recreation and o.exists():
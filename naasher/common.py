@@ -24,8 +24,6 @@ import os
 import sys
 import logging
 import click
-import copy
-import traceback as tb
 
 from pathlib import Path
 from typing import Any, Literal, Callable
@@ -43,6 +41,14 @@ class ColorizedLogFormatter(logging.Formatter):
             str(level_name), fg="bright_red"
         ),
     }
+    PATCHED_KEYS = (
+        "exc_class_name",
+        "petit_traceback",
+        "exception_message",
+        "msg",
+        "message",
+        "levelprefix",
+    )
 
     def __init__(
         self,
@@ -51,6 +57,9 @@ class ColorizedLogFormatter(logging.Formatter):
         style: Literal["%", "{", "$"] = "%",
     ):
         super().__init__(fmt, datefmt, style)
+        self.needs_exception_info = fmt is not None and any(
+            k in fmt for k in ("exc_class_name", "exception_message", "petit_traceback")
+        )
 
     def color_level_name(self, level_name: str, level_no: int) -> str:
         def default(level_name: str) -> str:
@@ -59,7 +68,7 @@ class ColorizedLogFormatter(logging.Formatter):
         func = self.level_name_colors.get(level_no, default)
         return func(level_name)
 
-    def formatMessage(self, record: logging.LogRecord) -> str:
+    def exception_info(self) -> tuple[str, str, str]:
         current_exception_class, exception, _ = sys.exc_info()
         exception_message = "<none>"
         exc_class_name = "<none>"
@@ -79,29 +88,32 @@ class ColorizedLogFormatter(logging.Formatter):
                 fg="bright_cyan",
             )
         traceback_items = []
+        cwd = os.getcwd()
         while exception is not None:
-            if exception.__traceback__:
-                for s in tb.extract_tb(exception.__traceback__):
-                    f = Path(s.filename)
-                    if not f.is_relative_to(MODULE_PATH.parent):
-                        traceback_items.append("...")
-                        continue
-                    traceback_items.append(
-                        f"{os.path.relpath(str(f), os.getcwd())}:{s.lineno}"
-                    )
+            # Walk the frames directly instead of building `FrameSummary`s
+            t = exception.__traceback__
+            while t is not None:
+                f = t.tb_frame.f_code.co_filename
+                if Path(f).is_relative_to(MODULE_PATH.parent):
+                    traceback_items.append(f"{os.path.relpath(f, cwd)}:{t.tb_lineno}")
+                else:
+                    traceback_items.append("...")
+                t = t.tb_next
             exception = exception.__cause__ or exception.__context__
         if traceback_items:
-            execution_count = 1
-            for i in range(len(traceback_items) - 1, 0, -1):
-                if traceback_items[i] == traceback_items[i - 1]:
-                    execution_count += 1
-                    del traceback_items[i]
-                else:
-                    if execution_count > 1:
-                        traceback_items[i] = (
-                            f"{traceback_items[i]} (x{execution_count})"
-                        )
-                    execution_count = 1
+            # Collapse runs of the same frame, e.g. for recursive calls
+            deduped_items = []
+            last_index = len(traceback_items) - 1
+            execution_count = 0
+            for i, item in enumerate(traceback_items):
+                execution_count += 1
+                if i < last_index and traceback_items[i + 1] == item:
+                    continue
+                deduped_items.append(
+                    item if execution_count == 1 else f"{item} (x{execution_count})"
+                )
+                execution_count = 0
+            traceback_items = deduped_items
             petit_traceback = click.style(
                 "\n=> ".join(
                     " => ".join(traceback_items[i : i + 4])
@@ -109,20 +121,39 @@ class ColorizedLogFormatter(logging.Formatter):
                 ),
                 fg="cyan",
             )
-        recordcopy = copy.copy(record)
-        levelname = recordcopy.levelname
+        return exc_class_name, exception_message, petit_traceback
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        if self.needs_exception_info:
+            exc_class_name, exception_message, petit_traceback = (
+                self.exception_info()
+            )
+        else:
+            exc_class_name = exception_message = petit_traceback = "<none>"
+        levelname = record.levelname
         seperator = " " * (8 - len(levelname))
-        levelname = self.color_level_name(levelname, recordcopy.levelno)
-        recordcopy.__dict__["exc_class_name"] = exc_class_name
-        recordcopy.__dict__["petit_traceback"] = petit_traceback
-        recordcopy.__dict__["exception_message"] = exception_message
-        if "color_message" in recordcopy.__dict__:
-            recordcopy.msg = recordcopy.__dict__["color_message"]
-            recordcopy.__dict__["message"] = recordcopy.getMessage()
-        recordcopy.__dict__["levelprefix"] = f"{levelname}:{seperator}"
+        levelname = self.color_level_name(levelname, record.levelno)
+        # The record is shared by all handlers, so it is patched for this
+        # formatter only and restored afterwards
+        record_dict = record.__dict__
+        saved = {k: record_dict[k] for k in self.PATCHED_KEYS if k in record_dict}
+        try:
+            record_dict["exc_class_name"] = exc_class_name
+            record_dict["petit_traceback"] = petit_traceback
+            record_dict["exception_message"] = exception_message
+            if "color_message" in record_dict:
+                record.msg = record_dict["color_message"]
+                record_dict["message"] = record.getMessage()
+            record_dict["levelprefix"] = f"{levelname}:{seperator}"
+            message = super().formatMessage(record)
+        finally:
+            for k in self.PATCHED_KEYS:
+                if k in saved:
+                    record_dict[k] = saved[k]
+                else:
+                    record_dict.pop(k, None)
         return "\n".join(
-            l if i == 0 else f"{' ' * 10}{l}"
-            for i, l in enumerate(super().formatMessage(recordcopy).split("\n"))
+            l if i == 0 else f"{' ' * 10}{l}" for i, l in enumerate(message.split("\n"))
         )
 
 
@@ -8,12 +8,29 @@
 # 1461=(365*4)+(4/4)   &   146097=(365*400)+(400/4)-(400/100)+(400/400)
 
 import re
-from typing import Any, Callable, NoReturn
+from bisect import bisect_left
+from typing import Any, Callable, NamedTuple, NoReturn
 from datetime import datetime
-
-
+from functools import lru_cache
+
+GREGORIAN_DAYS_BEFORE_MONTH = (0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334)
+GREGORIAN_LEAP_DAYS_BEFORE_MONTH = (
+    0,
+    31,
+    60,
+    91,
+    121,
+    152,
+    182,
+    213,
+    244,
+    274,
+    305,
+    335,
+)
+
+@lru_cache(maxsize=4096)
 def gregorian_to_jalali(gy: int, gm: int, gd: int):
-    g_d_m = [0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334]
     if gm > 2:
         gy2 = gy + 1
     else:
@@ -25,7 +42,7 @@ def gregorian_to_jalali(gy: int, gm: int, gd: int):
         - ((gy2 + 99) // 100)
         + ((gy2 + 399) // 400)
         + gd
-        + g_d_m[gm - 1]
+        + GREGORIAN_DAYS_BEFORE_MONTH[gm - 1]
     )
     jy = -1595 + (33 * (days // 12053))
     days %= 12053
@@ -43,6 +60,7 @@ def gregorian_to_jalali(gy: int, gm: int, gd: int):
     return (jy, jm, jd), days
 
 
+@lru_cache(maxsize=4096)
 def jalali_to_gregorian(jy: int, jm: int, jd: int):
     jy += 1595
     days = -355668 + (365 * jy) + ((jy // 33) * 8) + (((jy % 33) + 3) // 4) + jd
@@ -65,14 +83,11 @@ def jalali_to_gregorian(jy: int, jm: int, jd: int):
         days = (days - 1) % 365
     gd = days + 1
     if (gy % 4 == 0 and gy % 100 != 0) or (gy % 400 == 0):
-        kab = 29
+        days_before_month = GREGORIAN_LEAP_DAYS_BEFORE_MONTH
     else:
-        kab = 28
-    sal_a = [0, 31, kab, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
-    gm = 0
-    while gm < 13 and gd > sal_a[gm]:
-        gd -= sal_a[gm]
-        gm += 1
+        days_before_month = GREGORIAN_DAYS_BEFORE_MONTH
+    gm = bisect_left(days_before_month, gd)
+    gd -= days_before_month[gm - 1]
     return (gy, gm, gd), days
 
 
@@ -109,9 +124,13 @@ def __create_jstrftime():
         "اسف",
     ]
 
-    class JDt(object):
-        def __init__(self, **kwargs):
-            self.__dict__.update(kwargs)
+    class JDt(NamedTuple):
+        y: int
+        m: int
+        d: int
+        wd: int
+        hour: int
+        days: int
 
     def NOT_IMPLEMENTED(directive: str):
         def raiser(dt: JDt):
@@ -162,28 +181,43 @@ def __create_jstrftime():
         else:
             (y, m, d), days = (dt.year, dt.month, dt.day), dt.timetuple().tm_yday
         wd = dt.toordinal() % 7
-        return JDt(y=y, m=m, d=d, wd=wd, hour=dt.hour, days=days)
+        return JDt(y, m, d, wd, dt.hour, days)
 
-    def create_formatter(dt: datetime, is_solar_hijri: bool):
-        def formatter(m: re.Match[str]):
-            if len(m.group(1)) % 2 == 0:
-                return m.group(0)
-            return m.group(1)[:-1] + PRE_FORMATTERS[m.group(2)](to_jdt(dt, is_solar_hijri))
+    # A token is either a literal (`None`, text) or a directive (formatter, key)
+    FormatTokens = tuple[bool, list[tuple[Callable[[Any], str] | None, str]], bool]
+    FORMAT_CACHE: dict[str, FormatTokens] = {}
 
-        return formatter
-
-    def jstrftime(dt: datetime, format: str) -> str:
+    def parse_format(format: str) -> FormatTokens:
         is_solar_hijri = False
         for suffix in ("SHC", "JC"):
             if format.endswith(suffix):
                 is_solar_hijri = True
                 format = format[: -len(suffix)]
-        corrected_format = re.sub(
-            DIR_REGEX if is_solar_hijri else U_REGEX,
-            create_formatter(dt, is_solar_hijri),
-            format,
-        )
-        return dt.strftime(corrected_format)
+        # Split the format into literal parts, left for `strftime`, and the
+        # directives handled here
+        tokens: list[tuple[Callable[[Any], str] | None, str]] = []
+        i = 0
+        for m in (DIR_REGEX if is_solar_hijri else U_REGEX).finditer(format):
+            if len(m.group(1)) % 2 == 0:
+                continue
+            tokens.append((None, format[i : m.start()] + m.group(1)[:-1]))
+            tokens.append((PRE_FORMATTERS[m.group(2)], m.group(2)))
+            i = m.end()
+        tokens.append((None, format[i:]))
+        needs_strftime = any("%" in t for f, t in tokens if f is None)
+        return is_solar_hijri, tokens, needs_strftime
+
+    def jstrftime(dt: datetime, format: str) -> str:
+        parsed_format = FORMAT_CACHE.get(format)
+        if parsed_format is None:
+            parsed_format = FORMAT_CACHE[format] = parse_format(format)
+        is_solar_hijri, tokens, needs_strftime = parsed_format
+        if len(tokens) > 1:
+            jdt = to_jdt(dt, is_solar_hijri)
+            result = "".join(t if f is None else f(jdt) for f, t in tokens)
+        else:
+            result = tokens[0][1]
+        return dt.strftime(result) if needs_strftime else result
 
     return jstrftime
 
@@ -21,12 +21,19 @@
 # =================================================================================
 
 import os
+import json
+import threading
 from py_mini_racer import MiniRacer
 
 from .common import LOGGER
 
-def __create_js_interface(name: str, spec: dict):
-    console_members = { "log": "info", "warn": "warning", "error": "error" }
+CONSOLE_MEMBERS = { "log": "info", "warn": "warning", "error": "error" }
+# What each library leaves behind in its own scope, published as a global
+# named after the library
+LIBRARY_EXPORTS = { "csso": "csso", "uglifyjs3": "{ minify }", "temml": "temml" }
+
+def __create_js_context():
+    console_members = CONSOLE_MEMBERS
     context = MiniRacer()
     console_script = "function console_impl(t) { return function() { this[t].push([...arguments].map(e => `${e}`).join('|')) } }; console = { };"
     for m in console_members.keys():
@@ -36,19 +43,51 @@ def __create_js_interface(name: str, spec: dict):
         console_script += f"this.{m}__ = [];"
     console_script += "}"
     context.eval(console_script)
-    with open(os.path.join(os.path.dirname(__file__), f"./js/{name}.min.js")) as f:
-        context.eval(f.read())
-    def call_show_logs(*args, **kwargs):
-        context.eval("console.clear();")
-        result = context.call(spec["entry"], *args, **kwargs)
+    return context
+
+__js_context = __create_js_context()
+__js_context_lock = threading.Lock()
+__loaded_libraries: set[str] = set()
+
+def __create_js_interface(name: str, spec: dict):
+    console_members = CONSOLE_MEMBERS
+    library = spec.get("library", name)
+    context, context_lock = __js_context, __js_context_lock
+    def ensure_loaded():
+        # Libraries are read and evaluated on first use only; the caller holds
+        # the context lock
+        if library in __loaded_libraries:
+            return
+        with open(os.path.join(os.path.dirname(__file__), f"./js/{library}.min.js")) as f:
+            # All libraries share one context, so each one is evaluated in a
+            # function scope to keep its top level names to itself
+            context.eval(f"globalThis.{library} = (function() {{\n{f.read()}\n;return {LIBRARY_EXPORTS[library]}; }})();")
+        __loaded_libraries.add(library)
+    # Fetches and clears all the console buffers in a single round trip
+    pull_logs_script = "(function() { const logs = JSON.stringify({"
+    pull_logs_script += ", ".join(f"{m}: console.{m}__" for m in console_members.keys())
+    pull_logs_script += "}); console.clear(); return logs; })()"
+    def call_show_logs(*args):
+        # The console buffers belong to the context, so a call and reading
+        # back its logs must not interleave with calls from other threads
+        with context_lock:
+            ensure_loaded()
+            try:
+                result = context.call(spec["entry"], *args)
+            finally:
+                logs = json.loads(context.eval(pull_logs_script)) # type: ignore
         for m, n in console_members.items():
-            for l in context.eval(f"console.{m}__"): # type: ignore
+            for l in logs[m]:
                 getattr(LOGGER, n)(l)
         return result
+    defaults = spec["defaults"]
     def interface(*args, **kwargs__):
-        kwargs=spec["defaults"]
-        kwargs.update(kwargs__)
-        return call_show_logs(*args, **kwargs)
+        # Options go to the JS entry as its last argument, MiniRacer's own
+        # keyword arguments are not meant for them
+        kwargs = {**defaults, **kwargs__}
+        if kwargs:
+            args = (*args, kwargs)
+        return call_show_logs(*args)
     return interface
 
 
@@ -71,13 +110,19 @@ for name, spec in {
                 "drop_console": True,
             },
         },
-        "entry": "minify"
+        "entry": "uglifyjs3.minify"
     },
     "temml": {
         "defaults": { },
         "entry": "temml.renderToString"
     },
+    "temml_batch": {
+        "defaults": { },
+        "library": "temml",
+        "entry": "(function(literals, modes) { return literals.map((l, i) => temml.renderToString(l, { displayMode: modes[i] })) })"
+    },
 }.items():
     globals()[name] = __create_js_interface(name, spec)
 
-del __create_js_interface
\ No newline at end of file
+del __create_js_interface
+del __create_js_context
\ No newline at end of file
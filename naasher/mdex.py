@@ -20,38 +20,62 @@
 #  SOFTWARE.
 # =================================================================================
 
+import re
+import threading
+
+from html import unescape as unescape_html
 from typing import Any
 
-from .js import temml  # type:ignore
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import get_lexer_by_name, guess_lexer
+from commonmark.node import Node
+from commonmark.common import unescape_string
+from commonmark.blocks import Block, BlockStarts, peek, is_space_or_tab
+from commonmark.inlines import InlineParser
+from commonmark import Parser, HtmlRenderer
+
+# Dirty hack for a library that deserves it >:(
+import commonmark.blocks
+
+commonmark.blocks.reMaybeSpecial = re.compile(r"^[#\$`~*+_=<>0-9-]")
+import commonmark.inlines
+
+commonmark.inlines.reMain = re.compile(r'^[^\n\$`\[\]\\!<&*_\'"]+', re.MULTILINE)
+
+from .js import temml, temml_batch  # type:ignore
 
 MATH_EXPR_PATTERN = r"\$(?:[^\$\s]|\\\$)((?:[^\$]|\\\$)*(?:[^\$\s]|\\\$))?\$"
 HTML_FORMATTER_STYLE = "algol_nu"
+HTML_FORMATTER = HtmlFormatter(style=HTML_FORMATTER_STYLE)
 
-def create_md_renderer():
-    import re
-    from html import unescape as unescape_html
-    from pygments import highlight
-    from pygments.lexers import get_lexer_by_name, guess_lexer
-    from pygments.formatters import HtmlFormatter
-    from commonmark.node import Node
-    from commonmark.common import unescape_string
-    from commonmark.blocks import Block, BlockStarts, peek, is_space_or_tab
-    from commonmark.inlines import InlineParser
-    from commonmark import Parser, HtmlRenderer
-
-    # Dirty hack for a library that deserves it >:(
-    import commonmark.blocks
-
-    commonmark.blocks.reMaybeSpecial = re.compile(r"^[#\$`~*+_=<>0-9-]")
-    import commonmark.inlines
-
-    commonmark.inlines.reMain = re.compile(r'^[^\n\$`\[\]\\!<&*_\'"]+', re.MULTILINE)
-
-    reMathExprHere = re.compile(f"^{MATH_EXPR_PATTERN}")
-    reSideNoteHere = re.compile(r"^\[>[^\]]+\]")
-    reMathFence = re.compile(r"^\${3,}(?!.*\$)")
-    reClosingMathFence = re.compile(r"^(?:\${3,})(?= *$)")
+reMathExprHere = re.compile(f"^{MATH_EXPR_PATTERN}")
+reSideNoteHere = re.compile(r"^\[>[^\]]+\]")
+# Anchored by `match` at `parser.next_nonspace`, hence no leading `^`
+reMathFence = re.compile(r"\${3,}(?!.*\$)")
+reClosingMathFence = re.compile(r"(?:\${3,})(?= *$)")
+
+RENDERED_MATH: dict[tuple[str, bool], str] = {}
+
+
+def render_math(literal: str, display: bool) -> str:
+    result = RENDERED_MATH.get((literal, display))
+    if result is None:
+        result = RENDERED_MATH[(literal, display)] = temml(
+            literal, {"displayMode": display}
+        )
+    return result
+
+
+def prerender_math(expressions: list[tuple[str, bool]]):
+    # One MiniRacer call for all the expressions not rendered so far
+    missing = [e for e in dict.fromkeys(expressions) if e not in RENDERED_MATH]
+    if missing:
+        results = temml_batch([l for l, _ in missing], [d for _, d in missing])
+        RENDERED_MATH.update(zip(missing, results))
 
+
+def create_md_renderer():
     class MathBlock(Block):
         accepts_lines = True
 
@@ -64,7 +88,7 @@ def create_md_renderer():
                     indent <= 3
                     and len(ln) >= parser.next_nonspace + 1
                     and ln[parser.next_nonspace] == container.fence_char
-                    and re.search(reClosingMathFence, ln[parser.next_nonspace :])
+                    and reClosingMathFence.match(ln, parser.next_nonspace)
                 )
                 if match and len(match.group()) >= container.fence_length:
                     # closing fence - we're at end of line, so we can return
@@ -104,7 +128,7 @@ def create_md_renderer():
         @staticmethod
         def fenced_math_block(parser, container=None):
             if not parser.indented:
-                m = re.search(reMathFence, parser.current_line[parser.next_nonspace :])
+                m = reMathFence.match(parser.current_line, parser.next_nonspace)
                 if m:
                     fence_length = len(m.group())
                     parser.close_unmatched_blocks()
@@ -167,6 +191,9 @@ def create_md_renderer():
     ParserEx.blocks = {"math_block": MathBlock}  # type:ignore
     ParserEx.blocks.update(Parser.blocks)  # type:ignore
 
+    lexers: dict[str, Any] = {}
+    guessed_lexers: dict[str, Any] = {}
+
     class HtmlRendererEx(HtmlRenderer):
 
         def tagd(
@@ -192,16 +219,21 @@ def create_md_renderer():
                 self.tag("/figure")
 
         def code_block(self, node, entering):
-            lexer = (
-                get_lexer_by_name(node.info) if node.info else guess_lexer(node.literal)
-            )
+            if node.info:
+                lexer = lexers.get(node.info)
+                if lexer is None:
+                    lexer = lexers[node.info] = get_lexer_by_name(node.info)
+            else:
+                lexer = guessed_lexers.get(node.literal)
+                if lexer is None:
+                    lexer = guessed_lexers[node.literal] = guess_lexer(node.literal)
             self.cr()
-            self.lit(highlight(node.literal, lexer, HtmlFormatter(style=HTML_FORMATTER_STYLE)))
+            self.lit(highlight(node.literal, lexer, HTML_FORMATTER))
             self.cr()
 
         def math(self, node, entering):
             self.tagd("span", {"class": "inline-math"})
-            self.lit(temml(node.literal, {"displayMode": False}))
+            self.lit(render_math(node.literal, False))
             self.tag("/span")
 
         def sidenote(self, node, entering):
@@ -214,12 +246,21 @@ def create_md_renderer():
         def math_block(self, node, entering):
             self.cr()
             self.tagd("div", {"class": "block-math"})
-            self.lit(temml(node.literal, {"displayMode": True}))
+            self.lit(render_math(node.literal, True))
             self.tag("/div")
             self.cr()
 
     def renderer(markdown: str) -> str:
         ast = renderer.__parser.parse(markdown)
+        expressions = []
+        walker = ast.walker()
+        event = walker.nxt()
+        while event:
+            node = event["node"]
+            if event["entering"] and node.t in ("math", "math_block"):
+                expressions.append((node.literal, node.t == "math_block"))
+            event = walker.nxt()
+        prerender_math(expressions)
         return renderer.__html.render(ast)
 
     renderer.__parser = ParserEx({})
@@ -228,11 +269,18 @@ def create_md_renderer():
     return renderer
 
 
-def get_stylesheet() -> str:
+md_renderers = threading.local()
+
+
+def get_renderer():
+    # commonmark parsers and renderers keep per document state, so each thread
+    # builds its own renderer once and keeps reusing it
     try:
-        result = get_stylesheet.__cached
-    except:
-        from pygments.formatters import HtmlFormatter
+        return md_renderers.renderer
+    except AttributeError:
+        renderer = md_renderers.renderer = create_md_renderer()
+        return renderer
 
-        result = get_stylesheet.__cached = HtmlFormatter(style=HTML_FORMATTER_STYLE).get_style_defs()
-    return result
+
+def get_stylesheet() -> str:
+    return HTML_FORMATTER.get_style_defs()